@@ -1,9 +1,14 @@
 import requests
 import pandas as pd
 import os
+import threading
+import time
+import sqlite3
+from contextlib import closing, contextmanager
 from requests.auth import HTTPBasicAuth
 from flask import Flask, jsonify, render_template, request, redirect, url_for, flash, send_file
 from io import BytesIO
+from datetime import date
 from dotenv import load_dotenv 
 
 # ---------------------------
@@ -23,8 +28,150 @@ BASE_URL = os.getenv("BASE_URL")
 API_KEY = os.getenv("API_KEY")
 PASSWORD = os.getenv("PASSWORD")
 
+# Timeout (segundos) de las llamadas a la API hechas con un lease tomado.
+# Bajo un lease se hacen como máximo dos llamadas, que deben terminar antes
+# de que expire.
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", 30))
+
+# ---------------------------
+# Configuración de bloqueos por usuario
+# ---------------------------
+
+# Archivo SQLite con los leases, compartido por todos los workers del servidor.
+# Debe estar en un directorio con escritura; se crea al tomar el primer lease.
+BLOQUEO_DB = os.getenv("BLOQUEO_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "bloqueos.db"))
+# Tiempo máximo (segundos) que un proceso espera por un usuario tomado por otro
+BLOQUEO_ESPERA = float(os.getenv("BLOQUEO_ESPERA", 30))
+# Duración (segundos) del lease: si un proceso muere sin liberar, el usuario se libera solo
+BLOQUEO_DURACION = float(os.getenv("BLOQUEO_DURACION", 120))
+
+if 2 * API_TIMEOUT >= BLOQUEO_DURACION:
+    raise ValueError("BLOQUEO_DURACION debe ser mayor que 2 * API_TIMEOUT")
+
 # ------------- FUNCIONES -----------------------
 
+# ---------------------------
+# Bloqueos por usuario entre procesos masivos
+# ---------------------------
+
+class TablaBloqueos:
+    """ Tabla de leases por userId en SQLite, compartida entre procesos """
+
+    def __init__(self, ruta=BLOQUEO_DB, duracion=BLOQUEO_DURACION, intervalo=0.1, timeout_sqlite=1.0):
+        self.ruta = ruta
+        self.duracion = duracion
+        self.intervalo = intervalo
+        # Espera máxima de cada consulta por el lock de SQLite; la espera
+        # total la controla `adquirir` con su propio límite
+        self.timeout_sqlite = timeout_sqlite
+        self._tabla_creada = False
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        # Una conexión por operación: sirve igual para hilos y procesos
+        conn = sqlite3.connect(self.ruta, timeout=self.timeout_sqlite, isolation_level=None)
+        return closing(conn)
+
+    def _asegurar_tabla(self, conn):
+        # La tabla se crea al primer uso para no fallar al importar la app
+        with self._lock:
+            if not self._tabla_creada:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS leases ("
+                    "user_id INTEGER PRIMARY KEY, trabajo TEXT NOT NULL, expira REAL NOT NULL)"
+                )
+                self._tabla_creada = True
+
+    def _intentar(self, conn, user_id, trabajo):
+        """ Devuelve el trabajo que tiene el lease, o None si se tomó """
+        ahora = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fila = conn.execute(
+                "SELECT trabajo, expira FROM leases WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            if fila is not None and fila[1] > ahora and fila[0] != trabajo:
+                return fila[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO leases (user_id, trabajo, expira) VALUES (?, ?, ?)",
+                (user_id, trabajo, ahora + self.duracion),
+            )
+            return None
+        finally:
+            conn.execute("COMMIT")
+
+    def adquirir(self, user_id, trabajo, espera=BLOQUEO_ESPERA):
+        """ Devuelve (adquirido, trabajo_en_conflicto) """
+        limite = time.monotonic() + espera
+        conflicto = None
+
+        with self._conectar() as conn:
+            self._asegurar_tabla(conn)
+            while True:
+                try:
+                    otro = self._intentar(conn, user_id, trabajo)
+                except sqlite3.OperationalError as e:
+                    # Otro proceso tiene la base ocupada: se reintenta dentro del límite
+                    if "locked" not in str(e) or time.monotonic() >= limite:
+                        raise
+                    time.sleep(self.intervalo)
+                    continue
+
+                if otro is None:
+                    return True, conflicto
+
+                conflicto = otro
+                if time.monotonic() >= limite:
+                    return False, conflicto
+                time.sleep(self.intervalo)
+
+    def liberar(self, user_id, trabajo):
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM leases WHERE user_id = ? AND trabajo = ?", (user_id, trabajo))
+
+
+# Los workers deben correr en la misma máquina y ver el mismo BLOQUEO_DB
+bloqueos_usuarios = TablaBloqueos()
+
+
+def nuevo_trabajo(nombre):
+    """ Identificador único del proceso masivo que toma los bloqueos """
+    return f"{nombre}-{os.getpid()}-{threading.get_ident()}-{time.monotonic_ns()}"
+
+
+def _nombre_trabajo(trabajo):
+    return trabajo.split("-", 1)[0]
+
+
+@contextmanager
+def bloqueo_usuario(user_id, trabajo, conflictos):
+    """
+    Toma el lease de un usuario mientras se le hacen los PUT.
+    Si otro proceso lo tenía, se registra en `conflictos`; si no se libera
+    a tiempo, o la tabla de bloqueos falla, se lanza TimeoutError y el
+    usuario se reporta como error.
+    """
+    try:
+        adquirido, otro = bloqueos_usuarios.adquirir(int(user_id), trabajo)
+    except sqlite3.Error as e:
+        raise TimeoutError(
+            f"No se pudo tomar el bloqueo del usuario {user_id} (BLOQUEO_DB={bloqueos_usuarios.ruta}): {e}"
+        )
+    if otro:
+        conflictos.append((int(user_id), _nombre_trabajo(otro)))
+    if not adquirido:
+        raise TimeoutError(f"Usuario {user_id} en uso por otro proceso ({_nombre_trabajo(otro)})")
+    try:
+        yield
+    finally:
+        try:
+            bloqueos_usuarios.liberar(int(user_id), trabajo)
+        except sqlite3.Error as e:
+            # El lease expira solo tras BLOQUEO_DURACION
+            print(f"Error al liberar bloqueo del usuario {user_id}: {e}")
+
+
+
 # ---------------------------
 # Función para obtener roles
 # ---------------------------
@@ -60,21 +207,60 @@ def get_roles():
 
 
 # ---------------------------
-# Función para obtener todos los usuarios
+# Filtros soportados por la API en /users
 # ---------------------------
-def get_all_users(items_per_page=200):
-    users = []
-    page = 1
 
-    # Definir niveles de acceso
-    niveles_permitidos = [4, 7]
+# locationId, isActive y un único accessLevel se envían como query params;
+# el resto de filtros se aplica mientras se recorren las páginas.
+
+def _fecha_iso(valor):
+    """ Devuelve la parte YYYY-MM-DD de una fecha de la API (o None) """
+    if not valor:
+        return None
+    return str(valor)[:10]
+
+
+def _usuario_cumple_filtros(user, niveles_permitidos, location_id, activo,
+                            fecha_desde, fecha_hasta, campo_fecha):
+    if niveles_permitidos is not None and user.get("accessLevel") not in niveles_permitidos:
+        return False
+    if location_id is not None and user.get("locationId") != location_id:
+        return False
+    if activo is not None and bool(user.get("isActive", True)) != activo:
+        return False
+    if fecha_desde or fecha_hasta:
+        fecha = _fecha_iso(user.get(campo_fecha))
+        if not fecha:
+            return False
+        if fecha_desde and fecha < fecha_desde:
+            return False
+        if fecha_hasta and fecha > fecha_hasta:
+            return False
+    return True
+
+
+# ---------------------------
+# Generador de usuarios filtrados (página por página)
+# ---------------------------
+def iter_users(items_per_page=200, niveles_permitidos=(4, 7), location_id=None, activo=None,
+               fecha_desde=None, fecha_hasta=None, campo_fecha="hireDate"):
+    params = {"itemsPerPage": items_per_page}
+
+    # Enviar a la API los filtros que soporta
+    if location_id is not None:
+        params["locationId"] = location_id
+    if activo is not None:
+        params["isActive"] = str(activo).lower()
+    if niveles_permitidos is not None and len(niveles_permitidos) == 1:
+        params["accessLevel"] = list(niveles_permitidos)[0]
+
+    fecha_desde = _fecha_iso(fecha_desde)
+    fecha_hasta = _fecha_iso(fecha_hasta)
+    page = 1
 
     while True:
         url = f"{BASE_URL}/users"
-        params = {
-            "itemsPerPage": items_per_page,
-            "page": page
-        }
+        params["page"] = page
         response = requests.get(url, params=params, auth=HTTPBasicAuth(API_KEY, PASSWORD), verify=False)
 
         if response.status_code != 200:
@@ -93,26 +279,29 @@ def get_all_users(items_per_page=200):
             break
 
         for user in user_list:
-            if user.get("accessLevel") in niveles_permitidos:
-                users.append({
-                    "userId": user.get("userId"),
-                    "username": user.get("username"),
-                    "firstName": user.get("firstName"),
-                    "lastName": user.get("lastName"),
-                    "email": user.get("email"),
-                    "accessLevel": user.get("accessLevel"),
-                    "accessLevelName": user.get("accessLevelName"),
-                    "isActive": "Activo" if user.get("isActive", True) else "Inactivo",
-                    "Fecha de Inicio": user.get("hireDate"),
-                    "Fecha de Inicio 1": user.get("startDate"),
-                    "Fecha de Expiración": user.get("expireDate"),
-                    "Location Id": user.get("locationId"),
-                    "Location Name": user.get("locationName")
-                })
+            # Se vuelve a validar aquí por si la API ignora algún filtro
+            if not _usuario_cumple_filtros(user, niveles_permitidos, location_id, activo,
+                                           fecha_desde, fecha_hasta, campo_fecha):
+                continue
+
+            yield {
+                "userId": user.get("userId"),
+                "username": user.get("username"),
+                "firstName": user.get("firstName"),
+                "lastName": user.get("lastName"),
+                "email": user.get("email"),
+                "accessLevel": user.get("accessLevel"),
+                "accessLevelName": user.get("accessLevelName"),
+                "isActive": "Activo" if user.get("isActive", True) else "Inactivo",
+                "Fecha de Inicio": user.get("hireDate"),
+                "Fecha de Inicio 1": user.get("startDate"),
+                "Fecha de Expiración": user.get("expireDate"),
+                "Location Id": user.get("locationId"),
+                "Location Name": user.get("locationName")
+            }
 
         page += 1
 
-    return users
 
 # ---------------------------
 # Función para asignar rol a usuario
@@ -124,7 +313,7 @@ def assign_role(user_id, role_ids, expire_date=None):
         "userId": int(user_id),
         "contentRoleAdd": [int(r) for r in role_ids]  
     }
-    response = requests.put(url, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), verify=False)
+    response = requests.put(url, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), timeout=API_TIMEOUT, verify=False)
     return response
 
 
@@ -139,7 +328,7 @@ def set_account_expiration(user_id, expire_date=None):
         payload["expireDate"] = None 
 
     url = f"{BASE_URL}/users"
-    response = requests.put(url, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), verify=False)
+    response = requests.put(url, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), timeout=API_TIMEOUT, verify=False)
     return response
 
 # ---------------------------
@@ -149,40 +338,46 @@ def cambiar_estado_usuarios(archivo, estado_objetivo):
     try:
         df = pd.read_excel(archivo)
     except Exception:
-        return None, None, None, "Error al leer el archivo Excel. Asegúrate que sea válido."
+        return None, None, None, [], "Error al leer el archivo Excel. Asegúrate que sea válido."
 
     if "userId" not in df.columns:
-        return None, None, None, "El archivo debe contener una columna llamada 'userId'."
+        return None, None, None, [], "El archivo debe contener una columna llamada 'userId'."
 
     activados = []
     ya_en_estado = []
     errores = []
+    conflictos = []
+    trabajo = nuevo_trabajo("activar_usuarios")
 
     for user_id in df["userId"].dropna().astype(int).tolist():
-        # Consultar estado actual
-        url_get = f"{BASE_URL}/users/{user_id}"
-        resp_get = requests.get(url_get, auth=HTTPBasicAuth(API_KEY, PASSWORD), verify=False)
-
-        if resp_get.status_code != 200:
-            errores.append((user_id, "No se pudo consultar"))
-            continue
-
-        user_data = resp_get.json()
-        if user_data.get("isActive") == estado_objetivo:
-            ya_en_estado.append(user_id)
-            continue
-
-        # Cambiar estado
-        payload = {"userId": user_id, "isActive": estado_objetivo}
-        url_put = f"{BASE_URL}/users"
-        resp_put = requests.put(url_put, auth=HTTPBasicAuth(API_KEY, PASSWORD), json=payload, verify=False)
-
-        if resp_put.status_code == 200:
-            activados.append(user_id)
-        else:
-            errores.append((user_id, resp_put.text))
+        try:
+            with bloqueo_usuario(user_id, trabajo, conflictos):
+                # Consultar estado actual
+                url_get = f"{BASE_URL}/users/{user_id}"
+                resp_get = requests.get(url_get, auth=HTTPBasicAuth(API_KEY, PASSWORD), timeout=API_TIMEOUT, verify=False)
+
+                if resp_get.status_code != 200:
+                    errores.append((user_id, "No se pudo consultar"))
+                    continue
+
+                user_data = resp_get.json()
+                if user_data.get("isActive") == estado_objetivo:
+                    ya_en_estado.append(user_id)
+                    continue
+
+                # Cambiar estado
+                payload = {"userId": user_id, "isActive": estado_objetivo}
+                url_put = f"{BASE_URL}/users"
+                resp_put = requests.put(url_put, auth=HTTPBasicAuth(API_KEY, PASSWORD), json=payload, timeout=API_TIMEOUT, verify=False)
+
+                if resp_put.status_code == 200:
+                    activados.append(user_id)
+                else:
+                    errores.append((user_id, resp_put.text))
+        except (TimeoutError, requests.RequestException) as e:
+            errores.append((user_id, str(e)))
 
-    return activados, ya_en_estado, errores, None
+    return activados, ya_en_estado, errores, conflictos, None
 
 # ---------------------------
 # Función para actualizar usuarios (firstName o middleName)
@@ -191,11 +386,11 @@ def update_users_to_corporate(archivo):
     try:
         df = pd.read_excel(archivo)
     except Exception:
-        return [], ["Error al leer el archivo Excel. Asegúrate que sea válido."]
+        return [], ["Error al leer el archivo Excel. Asegúrate que sea válido."], []
 
     # Validamos solo columnas mínimas obligatorias
     if not all(col in df.columns for col in ["userId", "firstName", "lastName"]):
-        return [], ["El archivo debe contener al menos las columnas 'userId', 'firstName' y 'lastName'."]
+        return [], ["El archivo debe contener al menos las columnas 'userId', 'firstName' y 'lastName'."], []
 
     # Si no existe la columna middleName, la creamos vacía
     if "middleName" not in df.columns:
@@ -203,6 +398,8 @@ def update_users_to_corporate(archivo):
 
     actualizados = []
     errores = []
+    conflictos = []
+    trabajo = nuevo_trabajo("actualizar_usuarios")
 
     for _, row in df.iterrows():
         user_id = int(row["userId"])
@@ -237,14 +434,19 @@ def update_users_to_corporate(archivo):
         }
 
         url = f"{BASE_URL}/users"
-        resp = requests.put(url, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), verify=False)
+        try:
+            with bloqueo_usuario(user_id, trabajo, conflictos):
+                resp = requests.put(url, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), timeout=API_TIMEOUT, verify=False)
+        except (TimeoutError, requests.RequestException) as e:
+            errores.append((user_id, str(e)))
+            continue
 
         if resp.status_code == 200:
             actualizados.append((user_id, email))
         else:
             errores.append((user_id, resp.text))
 
-    return actualizados, errores
+    return actualizados, errores, conflictos
 
 # ---------------------------
 # Renombrar campos de usuarios inactivos
@@ -256,11 +458,13 @@ def renombrar_usuarios(file):
 
         # Validación de columnas mínimas
         if "userId" not in df.columns or "isActive" not in df.columns:
-            return [], ["El archivo no contiene las columnas necesarias (userId, isActive)"]
+            return [], ["El archivo no contiene las columnas necesarias (userId, isActive)"], []
 
         actualizados = []
         errores = []
+        conflictos = []
         contador = 1
+        trabajo = nuevo_trabajo("renombrar_usuarios")
 
         for _, row in df.iterrows():
             try:
@@ -282,12 +486,14 @@ def renombrar_usuarios(file):
                     }
 
                     url = f"{BASE_URL}/users"
-                    response = requests.put(
-                        url,
-                        json=payload,
-                        auth=HTTPBasicAuth(API_KEY, PASSWORD),
-                        verify=False
-                    )
+                    with bloqueo_usuario(user_id, trabajo, conflictos):
+                        response = requests.put(
+                            url,
+                            json=payload,
+                            auth=HTTPBasicAuth(API_KEY, PASSWORD),
+                            timeout=API_TIMEOUT,
+                            verify=False
+                        )
 
                     if response.status_code == 200:
                         actualizados.append(user_id)
@@ -300,10 +506,10 @@ def renombrar_usuarios(file):
             except Exception as e:
                 errores.append(f"Error procesando usuario {row.get('userId')}: {str(e)}")
 
-        return actualizados, errores
+        return actualizados, errores, conflictos
 
     except Exception as e:
-        return [], [f"Error leyendo archivo: {str(e)}"]
+        return [], [f"Error leyendo archivo: {str(e)}"], []
 
 
 # ---------------------------
@@ -401,58 +607,112 @@ def crear_usuarios(archivo, access_level=7, location_id=137980, default_password
 def resetear_passwords_masivo(df, new_password="Temp1234"):
     actualizados = []
     errores = []
+    conflictos = []
+    trabajo = nuevo_trabajo("resetear_passwords")
 
     for user_id in df["userId"].dropna().astype(int).tolist():
         try:
-            # Consultar usuario
-            url_get = f"{BASE_URL}/users/{user_id}"
-            resp_get = requests.get(url_get, auth=HTTPBasicAuth(API_KEY, PASSWORD), verify=False)
+            with bloqueo_usuario(user_id, trabajo, conflictos):
+                # Consultar usuario
+                url_get = f"{BASE_URL}/users/{user_id}"
+                resp_get = requests.get(url_get, auth=HTTPBasicAuth(API_KEY, PASSWORD), timeout=API_TIMEOUT, verify=False)
+
+                if resp_get.status_code != 200:
+                    errores.append((user_id, "No se pudo consultar"))
+                    continue
+
+                user_data = resp_get.json()
+                username = user_data.get("username")
+
+                payload = {
+                    "userId": user_id,
+                    "username": username,
+                    "password": new_password,
+                    "locationId": user_data.get("locationId"),
+                    "lockUsernamePassword": True,
+                    "forcePasswordUpdate": True,
+                    "isActive": True
+                }
+
+                url_put = f"{BASE_URL}/users"
+                resp_put = requests.put(url_put, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), timeout=API_TIMEOUT, verify=False)
+
+                if resp_put.status_code == 200:
+                    actualizados.append(user_id)
+                else:
+                    errores.append((user_id, resp_put.text))
 
-            if resp_get.status_code != 200:
-                errores.append((user_id, "No se pudo consultar"))
-                continue
+        except Exception as e:
+            errores.append((user_id, str(e)))
 
-            user_data = resp_get.json()
-            username = user_data.get("username")
+    return actualizados, errores, conflictos
 
-            payload = {
-                "userId": user_id,
-                "username": username,
-                "password": new_password,
-                "locationId": user_data.get("locationId"),
-                "lockUsernamePassword": True,
-                "forcePasswordUpdate": True,
-                "isActive": True
-            }
 
-            url_put = f"{BASE_URL}/users"
-            resp_put = requests.put(url_put, json=payload, auth=HTTPBasicAuth(API_KEY, PASSWORD), verify=False)
 
-            if resp_put.status_code == 200:
-                actualizados.append(user_id)
-            else:
-                errores.append((user_id, resp_put.text))
+# --------------------------------------------------- RUTAS ---------------------------------------------
 
-        except Exception as e:
-            errores.append((user_id, str(e)))
+# ---------------------------
+# Mostrar usuarios que estaban tomados por otro proceso
+# ---------------------------
+def flash_conflictos(conflictos):
+    if conflictos:
+        detalle = ", ".join(f"{user_id} ({trabajo})" for user_id, trabajo in conflictos)
+        flash(f"Usuarios en uso por otro proceso durante la ejecución: {len(conflictos)} ({detalle})", "info")
 
-    return actualizados, errores   # <-- 🔹 SOLO DOS VALORES
 
+# ---------------------------
+# Leer filtros de exportación desde la URL
+# ---------------------------
+def filtros_desde_request(args):
+    filtros = {}
 
+    # Sin el parámetro se usan los niveles por defecto; vacío o "todos" no filtra
+    if "niveles" in args:
+        niveles = args.get("niveles").strip()
+        if not niveles or niveles.lower() == "todos":
+            filtros["niveles_permitidos"] = None
+        else:
+            filtros["niveles_permitidos"] = tuple(int(n) for n in niveles.split(",") if n.strip())
+
+    location_id = args.get("location_id")
+    if location_id:
+        filtros["location_id"] = int(location_id)
+
+    estado = args.get("estado")
+    if estado == "activo":
+        filtros["activo"] = True
+    elif estado == "inactivo":
+        filtros["activo"] = False
+
+    # fromisoformat lanza ValueError con fechas inválidas
+    if args.get("desde"):
+        filtros["fecha_desde"] = date.fromisoformat(args.get("desde")).isoformat()
+    if args.get("hasta"):
+        filtros["fecha_hasta"] = date.fromisoformat(args.get("hasta")).isoformat()
+    if filtros.get("fecha_desde") and filtros.get("fecha_hasta") and filtros["fecha_desde"] > filtros["fecha_hasta"]:
+        raise ValueError("La fecha 'desde' es posterior a 'hasta'")
+    if args.get("campo_fecha") in ("hireDate", "startDate", "expireDate"):
+        filtros["campo_fecha"] = args.get("campo_fecha")
+
+    return filtros
 
-# --------------------------------------------------- RUTAS ---------------------------------------------
 
 # ---------------------------
 # Ruta para exportar usuarios a Excel
 # ---------------------------
 @app.route("/export_users")
 def export_users():
-    users = get_all_users()
-    if not users:
+    try:
+        filtros = filtros_desde_request(request.args)
+    except ValueError:
+        flash("Filtros de exportación inválidos.", "danger")
+        return redirect(url_for("gestion_usuarios"))
+
+    df = pd.DataFrame(iter_users(**filtros))
+    if df.empty:
         flash("No se encontraron usuarios.", "danger")
-        return redirect(url_for("index"))
+        return redirect(url_for("gestion_usuarios"))
 
-    df = pd.DataFrame(users)
     output = BytesIO()
     with pd.ExcelWriter(output, engine="openpyxl") as writer:
         df.to_excel(writer, index=False, sheet_name="Usuarios")
@@ -481,7 +741,7 @@ def activar_usuarios():
         # Determinar si activar o inactivar
         estado_objetivo = True if accion == "activar" else False
 
-        activados, ya_en_estado, errores, error_msg = cambiar_estado_usuarios(archivo, estado_objetivo)
+        activados, ya_en_estado, errores, conflictos, error_msg = cambiar_estado_usuarios(archivo, estado_objetivo)
 
         if error_msg:
             flash(error_msg, "danger")
@@ -494,6 +754,7 @@ def activar_usuarios():
                 flash(f"Usuarios ya estaban inactivos: {len(ya_en_estado)} ({ya_en_estado})", "info")
 
             flash(f"Errores: {len(errores)} ({errores})", "danger")
+            flash_conflictos(conflictos)
 
         return redirect(url_for("activar_usuarios"))
 
@@ -511,13 +772,14 @@ def actualizar_usuarios():
             flash("Debes subir un archivo Excel", "danger")
             return redirect(url_for("actualizar_usuarios"))
 
-        actualizados, errores = update_users_to_corporate(archivo)
+        actualizados, errores, conflictos = update_users_to_corporate(archivo)
 
         if errores:
             flash(f"Usuarios actualizados: {len(actualizados)}", "success")
             flash(f"Errores en {len(errores)} usuarios: {errores}", "danger")
         else:
             flash(f"Todos los usuarios fueron actualizados correctamente: {len(actualizados)}", "success")
+        flash_conflictos(conflictos)
 
         return redirect(url_for("actualizar_usuarios"))
 
@@ -557,18 +819,21 @@ def roles():
             return redirect(url_for("roles"))
 
         errors = []
+        conflictos = []
         success_count = 0
+        trabajo = nuevo_trabajo("roles")
 
         for user_id in df["userId"].dropna().astype(int):
             try:
-                resp_role = assign_role(user_id, role_ids)
-                if resp_role.status_code != 200:
-                    errors.append(f"Error asignando roles a usuario {user_id}: {resp_role.text}")
+                with bloqueo_usuario(user_id, trabajo, conflictos):
+                    resp_role = assign_role(user_id, role_ids)
+                    if resp_role.status_code != 200:
+                        errors.append(f"Error asignando roles a usuario {user_id}: {resp_role.text}")
 
-                if expire_date:
-                    resp_exp = set_account_expiration(user_id, expire_date)
-                    if resp_exp.status_code != 200:
-                        errors.append(f"Error actualizando expiración de usuario {user_id}: {resp_exp.text}")
+                    if expire_date:
+                        resp_exp = set_account_expiration(user_id, expire_date)
+                        if resp_exp.status_code != 200:
+                            errors.append(f"Error actualizando expiración de usuario {user_id}: {resp_exp.text}")
 
                 success_count += 1
 
@@ -579,6 +844,7 @@ def roles():
             flash(f"Usuarios procesados correctamente: {success_count}. Errores: {len(errors)}", "warning")
         else:
             flash(f"Todos los usuarios fueron procesados correctamente: {success_count}", "success")
+        flash_conflictos(conflictos)
 
         return redirect(url_for("roles"))
 
@@ -605,13 +871,14 @@ def anonymize_users():
             flash("Debes subir un archivo Excel", "danger")
             return redirect(url_for("anonymize_users"))
 
-        actualizados, errores = renombrar_usuarios(archivo)
+        actualizados, errores, conflictos = renombrar_usuarios(archivo)
 
         if errores:
             flash(f"Usuarios actualizados: {len(actualizados)}", "success")
             flash(f"Errores en {len(errores)} usuarios: {errores}", "danger")
         else:
             flash(f"Todos los usuarios inactivos fueron anonimizados correctamente: {len(actualizados)}", "success")
+        flash_conflictos(conflictos)
 
         return redirect(url_for("anonymize_users"))
 
@@ -683,9 +950,10 @@ def resetear_passwords_route():
 
     try:
         df = pd.read_excel(archivo)
-        actualizados, errores = resetear_passwords_masivo(df)
+        actualizados, errores, conflictos = resetear_passwords_masivo(df)
 
         flash(f"Se actualizaron {len(actualizados)} usuarios. Errores: {len(errores)}", "success")
+        flash_conflictos(conflictos)
     except Exception as e:
         flash(f"Error al procesar archivo: {e}", "danger")
 
@@ -0,0 +1,394 @@
+"""
+Prueba de carga de las rutas Flask contra un mock local de la API de LightSpeed VT.
+
+Uso:
+    python loadtest.py --concurrencia 8 --peticiones 40 --filas 200
+    python loadtest.py --rutas roles,export_users --latencia-api 50 --json resultado.json
+    python loadtest.py --rutas export_users --filtros-export "location_id=137980&estado=activo"
+
+Por defecto levanta app.py en este mismo proceso (servidor threaded de werkzeug).
+Para medir otra configuración de servidor (gunicorn, waitress, ...) se arranca
+con BASE_URL apuntando al mock y se indica con --target y --pids:
+
+    python loadtest.py --api-port 5055 --target http://127.0.0.1:8000 --pids 1234,1235
+
+Sin --target la memoria reportada es la de este proceso (app, mock y clientes juntos)
+y la app usa un BLOQUEO_DB temporal, aislado del de cualquier despliegue real.
+
+Se reportan por separado los errores HTTP (excepciones, status >= 400) y los
+errores de aplicación: exportaciones que no devuelven un xlsx, y POST cuyos
+mensajes flash reportan "Errores: N" o alertas "danger".
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urljoin
+
+import pandas as pd
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+# ---------------------------
+# Mock de la API de LightSpeed VT
+# ---------------------------
+def crear_api_mock(num_usuarios, latencia, semilla, tasa_fallos=0):
+    rnd = random.Random(semilla)
+    usuarios = {}
+    for user_id in range(1, num_usuarios + 1):
+        usuarios[user_id] = {
+            "userId": user_id,
+            "username": f"USUARIO{user_id}",
+            "firstName": f"Nombre{user_id}",
+            "lastName": f"Apellido{user_id}",
+            "email": f"usuario{user_id}@unacem.ec",
+            "accessLevel": rnd.choice([1, 4, 7]),
+            "accessLevelName": "Empleado",
+            "isActive": rnd.random() < 0.8,
+            "hireDate": f"202{rnd.randint(0, 5)}-0{rnd.randint(1, 9)}-15T00:00:00Z",
+            "startDate": None,
+            "expireDate": None,
+            "locationId": rnd.choice([137980, 137981, 137982]),
+            "locationName": "Planta",
+        }
+    lock = threading.Lock()
+    api = Flask("api_mock")
+
+    def esperar():
+        if latencia:
+            time.sleep(latencia / 1000)
+
+    @api.route("/contentRoles")
+    def content_roles():
+        esperar()
+        return jsonify([{"roleId": i, "contentRole": f"Rol {i}"} for i in range(1, 21)])
+
+    @api.route("/users", methods=["GET"])
+    def listar_usuarios():
+        esperar()
+        por_pagina = int(request.args.get("itemsPerPage", 200))
+        pagina = int(request.args.get("page", 1))
+        lista = list(usuarios.values())
+        if "locationId" in request.args:
+            lista = [u for u in lista if u["locationId"] == int(request.args["locationId"])]
+        if "isActive" in request.args:
+            lista = [u for u in lista if u["isActive"] == (request.args["isActive"] == "true")]
+        if "accessLevel" in request.args:
+            lista = [u for u in lista if u["accessLevel"] == int(request.args["accessLevel"])]
+        inicio = (pagina - 1) * por_pagina
+        return jsonify(lista[inicio:inicio + por_pagina])
+
+    @api.route("/users/<int:user_id>", methods=["GET"])
+    def obtener_usuario(user_id):
+        esperar()
+        user = usuarios.get(user_id)
+        if user is None:
+            return jsonify({"message": "Not found"}), 404
+        return jsonify(user)
+
+    @api.route("/users", methods=["PUT"])
+    def actualizar_usuario():
+        esperar()
+        payload = request.get_json(force=True)
+        with lock:
+            if tasa_fallos and rnd.random() < tasa_fallos:
+                return jsonify({"message": "Error simulado"}), 500
+            user = usuarios.get(int(payload.get("userId", 0)))
+            if user is None:
+                return jsonify({"message": "Not found"}), 404
+            user.update({k: v for k, v in payload.items() if k in user})
+        return jsonify(user)
+
+    @api.route("/users", methods=["POST"])
+    def crear_usuario():
+        esperar()
+        payload = request.get_json(force=True)
+        with lock:
+            user_id = max(usuarios) + 1
+            usuarios[user_id] = dict(payload, userId=user_id)
+        return jsonify({"userId": user_id}), 201
+
+    return api
+
+
+# ---------------------------
+# Servidor en segundo plano
+# ---------------------------
+def levantar_servidor(wsgi_app, port=0):
+    server = make_server("127.0.0.1", port, wsgi_app, threaded=True)
+    hilo = threading.Thread(target=server.serve_forever, daemon=True)
+    hilo.start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+# ---------------------------
+# Excel generado para las cargas
+# ---------------------------
+def generar_excel(filas, num_usuarios, rnd):
+    df = pd.DataFrame({"userId": [rnd.randint(1, num_usuarios) for _ in range(filas)]})
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine="openpyxl") as writer:
+        df.to_excel(writer, index=False, sheet_name="Usuarios")
+    return output.getvalue()
+
+
+# ---------------------------
+# Peticiones por ruta
+# ---------------------------
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def peticion(sesion, target, ruta, excel, rnd, filtros_export):
+    if ruta == "export_users":
+        return sesion.get(f"{target}/export_users", allow_redirects=False)
+    if ruta == "export_filtrado":
+        return sesion.get(f"{target}/export_users?{filtros_export}", allow_redirects=False)
+
+    archivo = {"archivo": ("carga.xlsx", excel, XLSX)}
+    if ruta == "roles":
+        data = {"role_id": [str(rnd.randint(1, 20))]}
+    elif ruta == "activar_usuarios":
+        data = {"accion": rnd.choice(["activar", "inactivar"])}
+    else:
+        raise ValueError(f"Ruta no soportada: {ruta}")
+    return sesion.post(f"{target}/{ruta}", data=data, files=archivo, allow_redirects=False)
+
+
+# ---------------------------
+# Errores de aplicación (flash tras el redirect)
+# ---------------------------
+ALERTA = re.compile(r'<div class="alert alert-(\w+)[^"]*">\s*(.*?)\s*</div>', re.S)
+ERRORES = re.compile(r"Errores: (\d+)")
+
+
+def errores_aplicacion(sesion, resp, ruta):
+    """ Devuelve cuántos errores reporta la app para una respuesta HTTP correcta """
+    if ruta in ("export_users", "export_filtrado"):
+        ok = resp.status_code == 200 and resp.headers.get("Content-Type", "").startswith(XLSX)
+        return 0 if ok else 1
+
+    if resp.status_code != 302:
+        return 1
+
+    # Seguir el redirect con la misma sesión para leer los mensajes flash
+    pagina = sesion.get(urljoin(resp.url, resp.headers["Location"]))
+    errores = 0
+    for categoria, mensaje in ALERTA.findall(pagina.text):
+        cantidad = ERRORES.search(mensaje)
+        if cantidad:
+            errores += int(cantidad.group(1))
+        elif categoria == "danger":
+            errores += 1
+    return errores
+
+
+# ---------------------------
+# Memoria de los workers (VmRSS en /proc)
+# ---------------------------
+def leer_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class MuestreoMemoria:
+    def __init__(self, pids, intervalo=0.2):
+        self.pids = pids
+        self.intervalo = intervalo
+        self.muestras = {pid: [] for pid in pids}
+        self._fin = threading.Event()
+        self._hilo = threading.Thread(target=self._correr, daemon=True)
+
+    def _correr(self):
+        while not self._fin.is_set():
+            for pid in self.pids:
+                rss = leer_rss_mb(pid)
+                if rss is not None:
+                    self.muestras[pid].append(rss)
+            self._fin.wait(self.intervalo)
+
+    def __enter__(self):
+        self._hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._fin.set()
+        self._hilo.join()
+
+    def resumen(self):
+        return {
+            pid: {"rss_prom_mb": round(statistics.mean(m), 1), "rss_max_mb": round(max(m), 1)}
+            for pid, m in self.muestras.items() if m
+        }
+
+
+# ---------------------------
+# Ejecución de la prueba
+# ---------------------------
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def ejecutar(args):
+    rnd = random.Random(args.semilla)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    api_server, api_url = levantar_servidor(
+        crear_api_mock(args.usuarios, args.latencia_api, args.semilla, args.fallos_api), args.api_port
+    )
+    print(f"API mock en {api_url}")
+
+    app_server = None
+    bloqueo_db = None
+    if args.target:
+        target = args.target.rstrip("/")
+        pids = [int(p) for p in args.pids.split(",") if p.strip()] if args.pids else []
+    else:
+        # Tabla de bloqueos propia de la corrida: no toca el bloqueos.db real
+        fd, bloqueo_db = tempfile.mkstemp(prefix="loadtest_bloqueos_", suffix=".db")
+        os.close(fd)
+        os.environ["BLOQUEO_DB"] = bloqueo_db
+        import app as app_module
+
+        app_module.BASE_URL = api_url
+        app_module.API_KEY = "loadtest"
+        app_module.PASSWORD = "loadtest"
+        app_module.app.secret_key = app_module.app.secret_key or "loadtest"
+        app_server, target = levantar_servidor(app_module.app)
+        pids = [os.getpid()]
+    print(f"App en {target}")
+
+    rutas = [r.strip() for r in args.rutas.split(",") if r.strip()]
+    if args.filtros_export and "export_users" in rutas and "export_filtrado" not in rutas:
+        rutas.append("export_filtrado")
+    excel = generar_excel(args.filas, args.usuarios, rnd)
+    trabajos = [(ruta, random.Random(rnd.random())) for ruta in rutas for _ in range(args.peticiones)]
+    rnd.shuffle(trabajos)
+
+    resultados = {
+        ruta: {"latencias": [], "errores_http": 0, "errores_app": 0, "errores_reportados": 0}
+        for ruta in rutas
+    }
+    lock = threading.Lock()
+
+    def correr(trabajo):
+        ruta, rnd_peticion = trabajo
+        sesion = requests.Session()
+        errores_http = errores_app = 0
+        inicio = time.perf_counter()
+        try:
+            resp = peticion(sesion, target, ruta, excel, rnd_peticion, args.filtros_export)
+            duracion = time.perf_counter() - inicio
+            if resp.status_code >= 400:
+                errores_http = 1
+            else:
+                errores_app = errores_aplicacion(sesion, resp, ruta)
+        except requests.RequestException:
+            duracion = time.perf_counter() - inicio
+            errores_http = 1
+        finally:
+            sesion.close()
+        with lock:
+            r = resultados[ruta]
+            r["latencias"].append(duracion)
+            r["errores_http"] += errores_http
+            r["errores_app"] += 1 if errores_app else 0
+            r["errores_reportados"] += errores_app
+
+    try:
+        with MuestreoMemoria(pids) as memoria:
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+                list(pool.map(correr, trabajos))
+            total = time.perf_counter() - inicio
+    finally:
+        if app_server:
+            app_server.shutdown()
+        api_server.shutdown()
+        if bloqueo_db:
+            os.remove(bloqueo_db)
+
+    reporte = {
+        "config": vars(args),
+        "duracion_s": round(total, 3),
+        "throughput_rps": round(len(trabajos) / total, 2),
+        "rutas": {},
+        "memoria": memoria.resumen(),
+    }
+    for ruta, r in resultados.items():
+        lat = r["latencias"]
+        reporte["rutas"][ruta] = {
+            "peticiones": len(lat),
+            "errores_http": r["errores_http"],
+            "tasa_error_http": round(r["errores_http"] / len(lat), 4) if lat else None,
+            "errores_app": r["errores_app"],
+            "tasa_error_app": round(r["errores_app"] / len(lat), 4) if lat else None,
+            "errores_reportados": r["errores_reportados"],
+            "p50_ms": round(percentil(lat, 50) * 1000, 1) if lat else None,
+            "p95_ms": round(percentil(lat, 95) * 1000, 1) if lat else None,
+            "p99_ms": round(percentil(lat, 99) * 1000, 1) if lat else None,
+            "max_ms": round(max(lat) * 1000, 1) if lat else None,
+            "throughput_rps": round(len(lat) / total, 2),
+        }
+    return reporte
+
+
+def imprimir(reporte):
+    print(f"\nDuración: {reporte['duracion_s']} s - Throughput total: {reporte['throughput_rps']} req/s\n")
+    print(f"{'Ruta':<20}{'Pet.':>6}{'HTTP':>6}{'App':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}{'req/s':>8}")
+    for ruta, r in reporte["rutas"].items():
+        print(f"{ruta:<20}{r['peticiones']:>6}{r['errores_http']:>6}{r['errores_app']:>6}{r['p50_ms']:>10}"
+              f"{r['p95_ms']:>10}{r['p99_ms']:>10}{r['max_ms']:>10}{r['throughput_rps']:>8}")
+    print("\nHTTP: excepciones o status >= 400. App: peticiones con errores reportados por la app.")
+    print("\nMemoria por worker (MB):")
+    for pid, m in reporte["memoria"].items():
+        print(f"  pid {pid}: promedio {m['rss_prom_mb']} - máximo {m['rss_max_mb']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga de las rutas de la app")
+    parser.add_argument("--rutas", default="roles,activar_usuarios,export_users")
+    parser.add_argument("--concurrencia", type=int, default=4, help="operadores simultáneos")
+    parser.add_argument("--peticiones", type=int, default=20, help="peticiones por ruta")
+    parser.add_argument("--filas", type=int, default=100, help="filas del Excel subido")
+    parser.add_argument("--usuarios", type=int, default=2000, help="usuarios en la API mock")
+    parser.add_argument("--latencia-api", type=float, default=0, help="latencia simulada de la API (ms)")
+    parser.add_argument("--fallos-api", type=float, default=0, help="fracción de PUT /users que fallan en el mock")
+    parser.add_argument("--filtros-export", help='query de /export_users filtrado, p. ej. "location_id=137980&estado=activo"')
+    parser.add_argument("--api-port", type=int, default=0)
+    parser.add_argument("--target", help="URL de una app ya levantada (por defecto se levanta app.py)")
+    parser.add_argument("--pids", help="pids de los workers del --target para medir memoria")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--json", help="archivo donde guardar el reporte")
+    args = parser.parse_args()
+
+    reporte = ejecutar(args)
+    imprimir(reporte)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()